@@ -6,6 +6,7 @@ Python utility functions that wrap the C parser.
 """
 
 import io
+import itertools
 
 from .cparser import Parser, Error as ParserError
 from .dialect import SimpleDialect
@@ -114,3 +115,9 @@ def parse_data(
 def parse_string(data, *args, **kwargs):
     """ Utility for when the CSV file is encoded as a single string """
     return parse_data(io.StringIO(data, newline=""), *args, **kwargs)
+
+
+def parse_cells(data, *args, **kwargs):
+    """ Utility that yields the cells of a CSV file encoded as a single string,
+    without the row structure. Arguments are as for parse_string. """
+    return itertools.chain.from_iterable(parse_string(data, *args, **kwargs))
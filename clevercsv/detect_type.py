@@ -9,10 +9,15 @@ Author: Gertjan van den Burg
 
 import regex
 
-from .cparser_util import parse_string
+from .cparser_util import parse_cells
 
 DEFAULT_EPS_TYPE = 1e-10
 
+# Maximum number of cells for which TypeDetector remembers the detected type, 
+# and the maximum length of such a cell
+MAX_CACHED_CELLS = 65536
+MAX_CACHED_CELL_LENGTH = 64
+
 # Used this site: https://unicode-search.net/unicode-namesearch.pl
 # Specials allowed in unicode_alphanum regex if is_quoted = False
 SPECIALS_ALLOWED = [
@@ -81,103 +86,278 @@ QUOTED_SPECIALS_ALLOWED = [
     "\uFE50",
 ]
 
+# Translation tables that delete the space and the specials allowed in the 
+# unicode_alphanum patterns
+ALPHANUM_DELETE = {ord(c): None for c in [" "] + SPECIALS_ALLOWED}
+ALPHANUM_QUOTED_DELETE = {
+    ord(c): None for c in [" "] + SPECIALS_ALLOWED + QUOTED_SPECIALS_ALLOWED
+}
+
+# The specials escaped for use in the character classes of the 
+# unicode_alphanum patterns
+SPECIALS_ESCAPED = regex.escape("".join(SPECIALS_ALLOWED))
+QUOTED_SPECIALS_ESCAPED = SPECIALS_ESCAPED + regex.escape(
+    "".join(QUOTED_SPECIALS_ALLOWED)
+)
+
 PATTERNS = {
-    "number_1": "^(?=[+-\.\d])[+-]?(?:0|[1-9]\d*)?(((?P<dot>((?<=\d)\.|\.(?=\d)))?(?(dot)(?P<yes_dot>\d*(\d*[eE][+-]?\d+)?)|(?P<no_dot>((?<=\d)[eE][+-]?\d+)?)))|((?P<comma>,)?(?(comma)(?P<yes_comma>\d+(\d+[eE][+-]?\d+)?)|(?P<no_comma>((?<=\d)[eE][+-]?\d+)?))))$",
+    "number_1": "^(?=[+-\.\d])[+-]?(?:0|[1-9]\d*)?(((?P<dot>((?<=\d)\.|\.(?=\d)))?(?(dot)(?P<yes_dot>\d*+([eE][+-]?\d+)?)|(?P<no_dot>((?<=\d)[eE][+-]?\d+)?)))|((?P<comma>,)?(?(comma)(?P<yes_comma>\d(\d++[eE][+-]?\d+|\d*+))|(?P<no_comma>((?<=\d)[eE][+-]?\d+)?))))$",
     "number_2": "[+-]?(?:[1-9]|[1-9]\d{0,2})(?:\,\d{3})+\.\d*",
     "number_3": "[+-]?(?:[1-9]|[1-9]\d{0,2})(?:\.\d{3})+\,\d*",
-    "url": "((https?|ftp):\/\/(?!\-))?(((([\p{L}\p{N}]*\-?[\p{L}\p{N}]+)+\.)+([a-z]{2,3}|local)(\.[a-z]{2,3})?)|localhost|(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}(\:\d{1,5})?))(\/[\p{L}\p{N}_\/()~?=&%\-\#\.]*)?(\.[a-z]+)?",
+    "url": "((https?|ftp):\/\/(?!\-))?((((\-?[\p{L}\p{N}]++)++\.)+([a-z]{2,3}|local)(\.[a-z]{2,3})?)|localhost|(\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}(\:\d{1,5})?))(\/[\p{L}\p{N}_\/()~?=&%\-\#\.]*)?(\.[a-z]+)?",
     "email": r"(^[a-zA-Z0-9_.+-]+@[a-zA-Z0-9-]+\.[a-zA-Z0-9-.]+$)",
     "ipv4": "(?:\d{1,3}\.){3}\d{1,3}",
-    "unicode_alphanum": "(\p{N}?\p{L}+[\p{N}\p{L}\ "
-    + regex.escape("".join(SPECIALS_ALLOWED))
-    + "]*|\p{L}?[\p{N}\p{L}\ "
-    + regex.escape("".join(SPECIALS_ALLOWED))
-    + "]+)",
-    "unicode_alphanum_quoted": "(\p{N}?\p{L}+[\p{N}\p{L}\ "
-    + regex.escape(
-        "".join(SPECIALS_ALLOWED) + "".join(QUOTED_SPECIALS_ALLOWED)
-    )
-    + "]*|\p{L}?[\p{N}\p{L}\ "
-    + regex.escape(
-        "".join(SPECIALS_ALLOWED) + "".join(QUOTED_SPECIALS_ALLOWED)
-    )
-    + "]+)",
+    "unicode_alphanum": "(\p{N}?+\p{L}++[\p{N}\p{L}\ "
+    + SPECIALS_ESCAPED
+    + "]*+|\p{L}?[\p{N}\p{L}\ "
+    + SPECIALS_ESCAPED
+    + "]++)",
+    "unicode_alphanum_quoted": "(\p{N}?+\p{L}++[\p{N}\p{L}\ "
+    + QUOTED_SPECIALS_ESCAPED
+    + "]*+|\p{L}?[\p{N}\p{L}\ "
+    + QUOTED_SPECIALS_ESCAPED
+    + "]++)",
     "time_hhmmss": "(0[0-9]|1[0-9]|2[0-3]):([0-5][0-9]):([0-5][0-9])",
     "time_hhmm": "(0[0-9]|1[0-9]|2[0-3]):([0-5][0-9])",
     "time_HHMM": "(0[0-9]|1[0-9]|2[0-3])([0-5][0-9])",
     "time_HH": "(0[0-9]|1[0-9]|2[0-3])([0-5][0-9])",
     "time_hmm": "([0-9]|1[0-9]|2[0-3]):([0-5][0-9])",
-    "currency": "\p{Sc}\s?(.*)",
-    "unix_path": "(\/|~\/|\.\/)(?:[a-zA-Z0-9\.\-\_]+\/?)+",
+    "currency_symbol": "\p{Sc}",
+    "unix_path": "(\/|~\/|\.\/)(?:[a-zA-Z0-9\.\-\_]++\/?)++",
     "date": "((0[1-9]|1[0-2])((0[1-9]|[12]\d|3[01])([12]\d{3}|\d{2})|(?P<sep1>[-\/. ])(0?[1-9]|[12]\d|3[01])(?P=sep1)([12]\d{3}|\d{2}))|(0[1-9]|[12]\d|3[01])((0[1-9]|1[0-2])([12]\d{3}|\d{2})|(?P<sep2>[-\/. ])(0?[1-9]|1[0-2])(?P=sep2)([12]\d{3}|\d{2}))|([12]\d{3}|\d{2})((?P<sep3>[-\/. ])(0?[1-9]|1[0-2])(?P=sep3)(0?[1-9]|[12]\d|3[01])|年(0?[1-9]|1[0-2])月(0?[1-9]|[12]\d|3[01])日|년(0?[1-9]|1[0-2])월(0?[1-9]|[12]\d|3[01])일|(0[1-9]|1[0-2])(0[1-9]|[12]\d|3[01]))|(([1-9]|1[0-2])(?P<sep4>[-\/. ])(0?[1-9]|[12]\d|3[01])(?P=sep4)([12]\d{3}|\d{2})|([1-9]|[12]\d|3[01])(?P<sep5>[-\/. ])(0?[1-9]|1[0-2])(?P=sep5)([12]\d{3}|\d{2})))",
 }
 
+# Alternatives that are tested together are combined into a single pattern, so 
+# that a cell needs only one regex call instead of one per alternative.
+PATTERNS["number"] = "|".join(
+    "(?:%s)" % PATTERNS[key] for key in ["number_1", "number_2", "number_3"]
+)
+PATTERNS["time"] = "|".join(
+    "(?:%s)" % PATTERNS[key]
+    for key in ["time_hmm", "time_hhmm", "time_hhmmss"]
+)
+
+# Date and time separated by a space, or by a "T" (iso) in which case the time 
+# can be followed by an offset "[+-][time]". After a second "+" (or "-") in the 
+# offset anything but "T" and space is allowed. Note that TypeDetector also 
+# requires that a datetime has at most one space.
+PATTERNS["datetime"] = (
+    "(?:{date})"
+    "(?: (?:{time})|T(?:{time})(?:\\+(?:{offset})(?:\\+[^T ]*)?"
+    "|-(?:{offset})(?:-[^T +]*)?)?)"
+).format(
+    date=PATTERNS["date"],
+    time=PATTERNS["time"],
+    offset="|".join(
+        "(?:%s)" % PATTERNS[key] for key in ["time", "time_HHMM", "time_HH"]
+    ),
+)
+
+# Types that are fully described by a single pattern. These are combined into 
+# a union with a named group per type, so that one regex call finds the type. 
+# The order is that of TypeDetector.detect_type, except that number is moved to 
+# the front: it is by far the most common type and it can't overlap with url, 
+# email, or ipv4.
+UNION_TYPES = [
+    "number",
+    "url",
+    "email",
+    "ipv4",
+    "time",
+    "unicode_alphanum",
+    "unix_path",
+    "date",
+]
+
+
+def _compile_union(is_quoted, leading_space):
+    types = list(UNION_TYPES)
+    if leading_space:
+        # is_time and is_date require the unstripped cell to start with a digit
+        types.remove("time")
+        types.remove("date")
+    groups = []
+    for name in types:
+        key = name
+        if name == "unicode_alphanum" and is_quoted:
+            key = "unicode_alphanum_quoted"
+        groups.append("(?P<%s>%s)" % (name, PATTERNS[key]))
+    return regex.compile("|".join(groups))
+
+
+# The patterns are compiled once on import and shared by all TypeDetectors. 
+# The unions are keyed on (is_quoted, leading_space).
+COMPILED_PATTERNS = {
+    key: regex.compile(value) for key, value in PATTERNS.items()
+}
+COMPILED_UNIONS = {
+    (is_quoted, leading_space): _compile_union(is_quoted, leading_space)
+    for is_quoted in [False, True]
+    for leading_space in [False, True]
+}
+
+
+def _is_plain_number(cell):
+    """
+    Quick check for the most common numbers: integers and decimals with a 
+    period, optionally signed (such as "-12" or "3.14"). This recognizes a 
+    subset of the number patterns using only string methods. Python and the 
+    regex module can use different versions of the Unicode database, so this 
+    only accepts ASCII digits. If it returns False, the cell may still be a 
+    number and the patterns need to be checked.
+    """
+    if cell[:1] in ("+", "-"):
+        cell = cell[1:]
+    if not cell or max(cell) >= "\x80":
+        return False
+    integer, _, fraction = cell.partition(".")
+    if integer and integer != "0":
+        if integer[0] not in "123456789":
+            return False
+        if len(integer) > 1 and not integer[1:].isdecimal():
+            return False
+    if fraction and not fraction.isdecimal():
+        return False
+    return bool(integer or fraction)
+
+
+def _is_plain_alphanum(cell, is_quoted=False):
+    """
+    Quick check for the unicode_alphanum type. Its patterns accept exactly the 
+    nonempty strings of letters, numbers, spaces, and allowed specials, so we 
+    delete the latter two and check the rest with str.isalnum. Python and the 
+    regex module can use different versions of the Unicode database, so this 
+    only accepts ASCII letters and numbers. If it returns False the patterns 
+    still need to be checked.
+    """
+    table = ALPHANUM_QUOTED_DELETE if is_quoted else ALPHANUM_DELETE
+    rest = cell.translate(table)
+    # str.isascii is not available on Python 3.6
+    return rest.isalnum() and max(rest) < "\x80"
+
 
 class TypeDetector(object):
     def __init__(self, strip_whitespace=True):
-        self.patterns = PATTERNS.copy()
         self.strip_whitespace = strip_whitespace
-        self._compile_regexes()
+        self.patterns = COMPILED_PATTERNS
+        self._unions = COMPILED_UNIONS
+
+        # The types that need more than a single pattern. None of these can
+        # match a cell that is matched by the union, so testing them after the
+        # union gives the same result as testing all types in order. These
+        # tests get the stripped cell. Datetime is tested last on the original
+        # cell, because is_datetime depends on the spaces in it.
+        self._type_tests = [
+            ("percentage", self.is_percentage),
+            ("currency", self.is_currency),
+            ("nan", self.is_nan),
+        ]
 
-    def _compile_regexes(self):
-        for key, value in self.patterns.items():
-            self.patterns[key] = regex.compile(value)
+        # Detected types by cell, separately for quoted and unquoted cells.
+        # Cells in CSV files are very repetitive, so this avoids most of the
+        # work in type detection. Only short cells are cached, and a
+        # TypeDetector should only be used for one file, so that we don't hold
+        # on to its data.
+        self._cache = {False: {}, True: {}}
+        self._cache_size = 0
 
     def is_known_type(self, cell, is_quoted=False):
-        return not self.detect_type(cell, is_quoted=is_quoted) is None
+        return self.detect_type(cell, is_quoted=is_quoted) is not None
 
     def detect_type(self, cell, is_quoted=False):
-        type_tests = [
-            ("empty", self.is_empty),
-            ("url", self.is_url),
-            ("email", self.is_email),
-            ("ipv4", self.is_ipv4),
-            ("number", self.is_number),
-            ("time", self.is_time),
-            ("percentage", self.is_percentage),
-            ("currency", self.is_currency),
-            ("unicode_alphanum", self.is_unicode_alphanum),
-            ("unix_path", self.is_unix_path),
-            ("nan", self.is_nan),
-            ("date", self.is_date),
-            ("datetime", self.is_datetime),
-        ]
-        for name, func in type_tests:
-            if func(cell, is_quoted=is_quoted):
+        cache = self._cache[bool(is_quoted)]
+        if cell in cache:
+            return cache[cell]
+        name = self._detect_type(cell, is_quoted=is_quoted)
+        if (
+            self._cache_size < MAX_CACHED_CELLS
+            and len(cell) <= MAX_CACHED_CELL_LENGTH
+        ):
+            cache[cell] = name
+            self._cache_size += 1
+        return name
+
+    def _detect_type(self, cell, is_quoted=False):
+        if self.strip_whitespace:
+            leading_space = cell.startswith(" ")
+            stripped = cell.strip(" ")
+        else:
+            leading_space = False
+            stripped = cell
+
+        if stripped == "":
+            return "empty"
+
+        # Number comes first in the union, so a plain number can skip it
+        if _is_plain_number(stripped):
+            return "number"
+
+        # The only types before unicode_alphanum that can match a cell of
+        # letters, numbers, and allowed specials are number (which starts
+        # with a digit, sign, period, or comma), url and ipv4 (which contain a
+        # period, or are "localhost"). Otherwise we can skip the union.
+        if (
+            stripped[0] not in "0123456789+-.,"
+            and "." not in stripped
+            and stripped != "localhost"
+            and _is_plain_alphanum(stripped, is_quoted=is_quoted)
+        ):
+            return "unicode_alphanum"
+
+        union = self._unions[(bool(is_quoted), leading_space)]
+        match = union.fullmatch(stripped)
+        if match is not None:
+            return match.lastgroup
+
+        for name, func in self._type_tests:
+            if func(stripped, is_stripped=True):
                 return name
+        if self.is_datetime(cell):
+            return "datetime"
         return None
 
-    def _run_regex(self, cell, patname):
-        if self.strip_whitespace:
+    def _run_regex(self, cell, patname, is_stripped=False):
+        if self.strip_whitespace and not is_stripped:
             cell = cell.strip(" ")
         pat = self.patterns.get(patname, None)
         match = pat.fullmatch(cell)
         return match is not None
 
-    def is_number(self, cell, **kwargs):
+    def is_number(self, cell, is_stripped=False, **kwargs):
         if cell == "":
             return False
-        if self._run_regex(cell, "number_1"):
-            return True
-        if self._run_regex(cell, "number_2"):
-            return True
-        if self._run_regex(cell, "number_3"):
+        if self.strip_whitespace and not is_stripped:
+            cell = cell.strip(" ")
+        if _is_plain_number(cell):
             return True
-        return False
+        return self._run_regex(cell, "number", is_stripped=True)
 
     def is_ipv4(self, cell, **kwargs):
+        if "." not in cell:
+            return False
         return self._run_regex(cell, "ipv4")
 
     def is_url(self, cell, **kwargs):
+        # every url that we accept has a period, except for localhost
+        if "." not in cell and "localhost" not in cell:
+            return False
         return self._run_regex(cell, "url")
 
     def is_email(self, cell, **kwargs):
+        if "@" not in cell:
+            return False
         return self._run_regex(cell, "email")
 
     def is_unicode_alphanum(self, cell, is_quoted=False, **kwargs):
+        if self.strip_whitespace:
+            cell = cell.strip(" ")
+        if _is_plain_alphanum(cell, is_quoted=is_quoted):
+            return True
         if is_quoted:
-            return self._run_regex(cell, "unicode_alphanum_quoted")
-        return self._run_regex(cell, "unicode_alphanum")
+            return self._run_regex(
+                cell, "unicode_alphanum_quoted", is_stripped=True
+            )
+        return self._run_regex(cell, "unicode_alphanum", is_stripped=True)
 
     def is_date(self, cell, **kwargs):
         # This function assumes the cell is not a number.
@@ -192,33 +372,33 @@ class TypeDetector(object):
             return False
         if not cell[0].isdigit():
             return False
-        return (
-            self._run_regex(cell, "time_hmm")
-            or self._run_regex(cell, "time_hhmm")
-            or self._run_regex(cell, "time_hhmmss")
-        )
+        if ":" not in cell:
+            return False
+        return self._run_regex(cell, "time")
 
     def is_empty(self, cell, **kwargs):
         if self.strip_whitespace:
             cell = cell.strip(" ")
         return cell == ""
 
-    def is_percentage(self, cell, **kwargs):
-        if self.strip_whitespace:
+    def is_percentage(self, cell, is_stripped=False, **kwargs):
+        if self.strip_whitespace and not is_stripped:
             cell = cell.strip(" ")
         return cell.endswith("%") and self.is_number(cell.rstrip("%"))
 
-    def is_currency(self, cell, **kwargs):
-        if self.strip_whitespace:
+    def is_currency(self, cell, is_stripped=False, **kwargs):
+        if self.strip_whitespace and not is_stripped:
             cell = cell.strip(" ")
-        pat = self.patterns.get("currency", None)
-        m = pat.fullmatch(cell)
-        if m is None:
+        if self.patterns["currency_symbol"].fullmatch(cell[:1]) is None:
             return False
-        grp = m.group(1)
-        if not self.is_number(grp):
+        amount = cell[1:]
+        # The symbol may be followed by a single whitespace character (as in
+        # the regex \s, which unlike str.isspace excludes \x1c-\x1f).
+        if amount[:1].isspace() and amount[0] not in "\x1c\x1d\x1e\x1f":
+            amount = amount[1:]
+        if "\n" in amount:
             return False
-        return True
+        return self.is_number(amount)
 
     def is_datetime(self, cell, **kwargs):
         # Takes care of cells with '[date] [time]' and '[date]T[time]' (iso)
@@ -226,60 +406,26 @@ class TypeDetector(object):
             return False
         if not cell[0].isdigit():
             return False
-        if " " in cell:
-            parts = cell.split(" ")
-            if len(parts) > 2:
-                return False
-            return self.is_date(parts[0]) and self.is_time(parts[1])
-        elif "T" in cell:
-            parts = cell.split("T")
-            if len(parts) > 2:
-                return False
-            isdate = self.is_date(parts[0])
-            if not isdate:
-                return False
-            # [date]T[time]
-            if self.is_time(parts[1]):
-                return True
-            # [date]T[time][+-][time]
-            if "+" in parts[1]:
-                subparts = parts[1].split("+")
-                istime1 = self.is_time(subparts[0])
-                istime2 = self.is_time(subparts[1])
-                if not istime1:
-                    return False
-                if istime2:
-                    return True
-                if self._run_regex(subparts[1], "time_HHMM"):
-                    return True
-                if self._run_regex(subparts[1], "time_HH"):
-                    return True
-            elif "-" in parts[1]:
-                subparts = parts[1].split("-")
-                istime1 = self.is_time(subparts[0])
-                istime2 = self.is_time(subparts[1])
-                if not istime1:
-                    return False
-                if istime2:
-                    return True
-                if self._run_regex(subparts[1], "time_HHMM"):
-                    return True
-                if self._run_regex(subparts[1], "time_HH"):
-                    return True
-        return False
+        if " " not in cell and "T" not in cell:
+            return False
+        if cell.count(" ") > 1:
+            return False
+        return self.patterns["datetime"].fullmatch(cell) is not None
 
-    def is_nan(self, cell, **kwargs):
-        if self.strip_whitespace:
+    def is_nan(self, cell, is_stripped=False, **kwargs):
+        if self.strip_whitespace and not is_stripped:
             cell = cell.strip(" ")
         # other forms (na and nan) are caught by unicode_alphanum
         if cell.lower() == "n/a":
             return True
         return False
 
-    def is_unix_path(self, cell, **kwargs):
-        if self.strip_whitespace:
+    def is_unix_path(self, cell, is_stripped=False, **kwargs):
+        if self.strip_whitespace and not is_stripped:
             cell = cell.strip(" ")
-        return self._run_regex(cell, "unix_path")
+        if cell[:1] not in ("/", "~", "."):
+            return False
+        return self._run_regex(cell, "unix_path", is_stripped=True)
 
 
 def gen_known_type(cells):
@@ -311,10 +457,9 @@ def type_score(data, dialect, eps=DEFAULT_EPS_TYPE):
     total = 0
     known = 0
     td = TypeDetector()
-    for row in parse_string(data, dialect, return_quoted=True):
-        for cell, is_quoted in row:
-            total += 1
-            known += td.is_known_type(cell, is_quoted=is_quoted)
+    for cell, is_quoted in parse_cells(data, dialect, return_quoted=True):
+        total += 1
+        known += td.is_known_type(cell, is_quoted=is_quoted)
     if total == 0:
         return eps
     return max(eps, known / total)
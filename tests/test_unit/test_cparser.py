@@ -10,7 +10,7 @@ Author: Gertjan van den Burg
 import io
 import unittest
 
-from clevercsv.cparser_util import parse_data
+from clevercsv.cparser_util import parse_data, parse_cells
 
 
 class ParserTestCase(unittest.TestCase):
@@ -383,6 +383,12 @@ class ParserTestCase(unittest.TestCase):
             return_quoted=True,
         )
 
+    def test_parse_cells(self):
+        result = list(
+            parse_cells('a,"b,c"\r\nd,e', delimiter=",", quotechar='"')
+        )
+        self.assertEqual(result, ["a", "b,c", "d", "e"])
+
 
 
 if __name__ == "__main__":
@@ -7,10 +7,16 @@ Author: Gertjan van den Burg
 
 """
 
+import time
 import unittest
 
 from clevercsv.dialect import SimpleDialect
-from clevercsv.detect_type import TypeDetector, type_score
+from clevercsv.detect_type import (
+    MAX_CACHED_CELLS,
+    MAX_CACHED_CELL_LENGTH,
+    TypeDetector,
+    type_score,
+)
 
 
 class TypeDetectorTestCase(unittest.TestCase):
@@ -173,6 +179,37 @@ class TypeDetectorTestCase(unittest.TestCase):
             with self.subTest(date=date):
                 self.assertFalse(self.td.is_date(date))
 
+    # Datetimes
+
+    def test_datetime(self):
+        yes_dt = [
+            "2019-12-21 12:30",
+            "2019-12-21 12:30:45",
+            "2019-12-21T12:30",
+            "2019-12-21T12:30:45",
+            "2019-12-21T12:30+01:00",
+            "2019-12-21T12:30-0100",
+            "21.12.2019 9:30",
+        ]
+        for dt in yes_dt:
+            with self.subTest(dt=dt):
+                self.assertTrue(self.td.is_datetime(dt))
+        no_dt = [
+            "",
+            "2019-12-21",
+            "12:30",
+            " 2019-12-21 12:30",
+            "2019-12-21  12:30",
+            "2019-12-21 12:30 ",
+            "03 12 2019 12:30",
+            "2019-12-21 T12:30",
+            "2019-12-21T12:30+",
+            "2019-12-21T25:30",
+        ]
+        for dt in no_dt:
+            with self.subTest(dt=dt):
+                self.assertFalse(self.td.is_datetime(dt))
+
     # URLs
 
     def test_url(self):
@@ -334,6 +371,92 @@ class TypeDetectorTestCase(unittest.TestCase):
             with self.subTest(path=path):
                 self.assertFalse(self.td.is_unix_path(path))
 
+    # Currency
+
+    def test_currency(self):
+        yes_currency = ["$10", "€ 1.000,00", "£0.50", "¥ 100", "$ -3.14"]
+        for cell in yes_currency:
+            with self.subTest(cell=cell):
+                self.assertTrue(self.td.is_currency(cell))
+        no_currency = ["", "$", "10$", "EUR 10", "$abc", "1.00"]
+        for cell in no_currency:
+            with self.subTest(cell=cell):
+                self.assertFalse(self.td.is_currency(cell))
+
+    # Detect type
+
+    def test_detect_type(self):
+        cells = [
+            ("", "empty"),
+            ("  ", "empty"),
+            ("123", "number"),
+            (" 1,234.56 ", "number"),
+            ("http://gertjan.dev", "url"),
+            ("a@b.com", "email"),
+            ("12:30", "time"),
+            ("12.5%", "percentage"),
+            ("$10", "currency"),
+            ("this is a cell", "unicode_alphanum"),
+            ("/home/username", "unix_path"),
+            ("N/A", "nan"),
+            ("2019-12-21", "date"),
+            ("2019-12-21T12:30", "datetime"),
+            ("12/30 (a)", None),
+        ]
+        for cell, exp in cells:
+            with self.subTest(cell=cell):
+                self.assertEqual(self.td.detect_type(cell), exp)
+        self.assertEqual(
+            self.td.detect_type("a, b", is_quoted=True), "unicode_alphanum"
+        )
+        self.assertIsNone(self.td.detect_type("a, b"))
+
+    def test_detect_type_long_cells(self):
+        # These cells almost match a pattern. They used to take seconds due to
+        # backtracking, so we check the type and use a generous time bound.
+        n = 50000
+        cells = [
+            ("1." + "1" * n + "x", "unicode_alphanum", self.td.is_number),
+            ("a" * n + ".a!", "unicode_alphanum", self.td.is_url),
+            ("1" + "a" * n + "#", None, self.td.is_unicode_alphanum),
+            ("/" + "a" * n + "#", None, self.td.is_unix_path),
+        ]
+        for cell, exp, func in cells:
+            with self.subTest(cell=cell[:10]):
+                start = time.perf_counter()
+                self.assertEqual(self.td.detect_type(cell), exp)
+                self.assertFalse(func(cell))
+                self.assertLess(time.perf_counter() - start, 5)
+
+    def test_detect_type_cache(self):
+        cells = [
+            "123",
+            " 123 ",
+            "a, b",
+            "2019-12-21",
+            "$10",
+            "12/30 (a)",
+            "a" * (MAX_CACHED_CELL_LENGTH + 1),
+        ]
+        uncached = TypeDetector()
+        for cell in cells:
+            for is_quoted in [False, True]:
+                exp = uncached._detect_type(cell, is_quoted=is_quoted)
+                with self.subTest(cell=cell, is_quoted=is_quoted):
+                    # the second call is answered from the cache
+                    for _ in range(2):
+                        self.assertEqual(
+                            self.td.detect_type(cell, is_quoted=is_quoted), exp
+                        )
+        self.assertNotIn(cells[-1], self.td._cache[False])
+        self.assertEqual(self.td._cache_size, 2 * (len(cells) - 1))
+
+        td = TypeDetector()
+        for i in range(MAX_CACHED_CELLS + 10):
+            self.assertEqual(td.detect_type(str(i)), "number")
+        self.assertEqual(td._cache_size, MAX_CACHED_CELLS)
+        self.assertEqual(len(td._cache[False]), MAX_CACHED_CELLS)
+
     """
     Type Score tests
     """